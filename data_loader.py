@@ -1,59 +1,263 @@
+import os
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
 from datetime import datetime
 
-@st.cache_data # Кэшируем данные для производительности
-def load_data(file_path='data/dataset.csv'):
+try:
+    import fcntl
+except ImportError: # Windows: общий датасет не поддерживается, см. load_shared_data
+    fcntl = None
+
+# Параметры чтения лога событий (используются и в live-режиме, см. live_tail.py)
+CSV_READ_OPTIONS = dict(
+    encoding='cp1251', # Очень вероятно, что это ваша кодировка
+    sep='\t',          # Используем табуляцию как разделитель
+    parse_dates=['start_time', 'end_time'],
+    dayfirst=True      # Указываем, что день идет первым в дате (ДД.ММ.ГГГГ)
+)
+
+# Обработанный датасет в формате Arrow/Feather, общий для всех процессов дашборда
+SHARED_DATASET_PATH = 'data/dataset.arrow'
+
+
+def add_event_features(df):
     """
-    Загружает и предобрабатывает данные из CSV файла.
+    Добавляет построчные признаки событий (длительность, дата, час, признак отмены).
+
+    Признаки зависят только от самой строки, поэтому их можно считать порциями
+    (например, для новых событий в live-режиме).
+
+    Args:
+        df (pd.DataFrame): Сырые данные с колонками case, stage, start_time, end_time и др.
+
+    Returns:
+        pd.DataFrame: Тот же DataFrame с добавленными колонками.
+    """
+    # Переименуем колонки для удобства (если нужно)
+    # df.rename(columns={'Территория': 'territory', 'Оценка доставки': 'rating'}, inplace=True)
+    # Оставляем оригинальные названия, т.к. они используются дальше
+
+    # Преобразуем 'Оценка доставки' в числовой тип, ошибки превратятся в NaN
+    df['Оценка доставки'] = pd.to_numeric(df['Оценка доставки'], errors='coerce')
+
+    # Рассчитываем длительность этапа в минутах
+    df['duration'] = (df['end_time'] - df['start_time']).dt.total_seconds() / 60
+    # Обработка некорректной длительности (если end_time < start_time или NaN)
+    df['duration'] = df['duration'].apply(lambda x: x if pd.notna(x) and x > 0 else 0)
+
+    # Создание дополнительных признаков
+    df['date'] = df['start_time'].dt.date
+    df['hour'] = df['start_time'].dt.hour
+    df['is_canceled'] = df['stage'].str.contains('Отмена', na=False).astype(int)
+
+    return df
+
+
+def add_order_status(df):
+    """
+    Добавляет колонку order_status по последнему этапу каждого заказа.
+
+    Статус зависит от всех этапов заказа, поэтому считается по полному набору данных.
+
+    Args:
+        df (pd.DataFrame): Данные с колонками case, stage, end_time.
+
+    Returns:
+        pd.DataFrame: Тот же DataFrame с колонкой order_status.
+    """
+    # Добавляем статус заказа (упрощенно)
+    # Находим последний этап для каждого заказа
+    last_stage = df.loc[df.groupby('case')['end_time'].idxmax()]
+    status_map = last_stage.set_index('case')['stage'].apply(
+        lambda x: 'Отменен' if 'Отмена' in str(x) else ('Доставлен' if 'доставлен' in str(x) else 'В процессе')
+    )
+    df['order_status'] = df['case'].map(status_map)
+
+    return df
+
+
+def preprocess_data(df):
+    """
+    Добавляет к сырому логу событий производные колонки (длительность, дата, час, статус заказа).
+
+    Args:
+        df (pd.DataFrame): Сырые данные с колонками case, stage, start_time, end_time и др.
+
+    Returns:
+        pd.DataFrame: Тот же DataFrame с добавленными колонками.
+    """
+    return add_order_status(add_event_features(df))
+
+
+def read_dataset(file_path):
+    """
+    Читает лог событий из CSV и предобрабатывает его.
 
     Args:
         file_path (str): Путь к файлу CSV.
 
     Returns:
-        pd.DataFrame: Загруженный и обработанный DataFrame, или пустой DataFrame при ошибке.
+        pd.DataFrame: Обработанный DataFrame.
     """
-    try:
-        # Указываем правильную кодировку и разделитель
-        df = pd.read_csv(
-            file_path,
-            encoding='cp1251', # Очень вероятно, что это ваша кодировка
-            sep='\t',          # Используем табуляцию как разделитель
-            parse_dates=['start_time', 'end_time'],
-            dayfirst=True      # Указываем, что день идет первым в дате (ДД.ММ.ГГГГ)
-        )
-
-        # Переименуем колонки для удобства (если нужно)
-        # df.rename(columns={'Территория': 'territory', 'Оценка доставки': 'rating'}, inplace=True)
-        # Оставляем оригинальные названия, т.к. они используются дальше
-
-        # Преобразуем 'Оценка доставки' в числовой тип, ошибки превратятся в NaN
-        df['Оценка доставки'] = pd.to_numeric(df['Оценка доставки'], errors='coerce')
-
-        # Рассчитываем длительность этапа в минутах
-        df['duration'] = (df['end_time'] - df['start_time']).dt.total_seconds() / 60
-        # Обработка некорректной длительности (если end_time < start_time или NaN)
-        df['duration'] = df['duration'].apply(lambda x: x if pd.notna(x) and x > 0 else 0)
-
-        # Создание дополнительных признаков
-        df['date'] = df['start_time'].dt.date
-        df['hour'] = df['start_time'].dt.hour
-        df['is_canceled'] = df['stage'].str.contains('Отмена', na=False).astype(int)
-
-        # Добавляем статус заказа (упрощенно)
-        # Находим последний этап для каждого заказа
-        last_stage = df.loc[df.groupby('case')['end_time'].idxmax()]
-        status_map = last_stage.set_index('case')['stage'].apply(
-            lambda x: 'Отменен' if 'Отмена' in str(x) else ('Доставлен' if 'доставлен' in str(x) else 'В процессе')
-        )
-        df['order_status'] = df['case'].map(status_map)
-
-
-        return df
+    # Указываем правильную кодировку и разделитель
+    return preprocess_data(pd.read_csv(file_path, **CSV_READ_OPTIONS))
+
+
+def _load_or_report(file_path, load):
+    """
+    Вызывает load() и показывает ошибку в интерфейсе вместо исключения.
+
+    Args:
+        file_path (str): Путь к исходному файлу CSV (для сообщения об ошибке).
+        load (callable): Функция без аргументов, возвращающая DataFrame.
 
+    Returns:
+        pd.DataFrame: Результат load(), или пустой DataFrame при ошибке.
+    """
+    try:
+        return load()
     except FileNotFoundError:
         st.error(f"Файл '{file_path}' не найден. Убедитесь, что он существует и путь указан верно.")
         return pd.DataFrame()
     except Exception as e:
         st.error(f"Ошибка при загрузке или обработке данных: {e}")
         return pd.DataFrame()
+
+
+@st.cache_data # Кэшируем данные для производительности
+def load_data(file_path='data/dataset.csv'):
+    """
+    Загружает и предобрабатывает данные из CSV файла.
+
+    Args:
+        file_path (str): Путь к файлу CSV.
+
+    Returns:
+        pd.DataFrame: Загруженный и обработанный DataFrame, или пустой DataFrame при ошибке.
+    """
+    return _load_or_report(file_path, lambda: read_dataset(file_path))
+
+
+def _source_signature(source_stat):
+    """Метаданные исходного CSV, по которым проверяется актуальность файла Arrow."""
+    return {
+        b'source_mtime_ns': str(source_stat.st_mtime_ns).encode(),
+        b'source_size': str(source_stat.st_size).encode(),
+    }
+
+
+def publish_dataset(df, arrow_path=SHARED_DATASET_PATH, source_stat=None):
+    """
+    Сохраняет обработанный датасет в файл Arrow/Feather для общего доступа.
+
+    Файл пишется без сжатия (иначе его нельзя отобразить в память без копирования)
+    во временный файл рядом и затем атомарно подменяет старую версию, поэтому
+    читатели видят либо старую, либо новую версию целиком.
+
+    Args:
+        df (pd.DataFrame): Обработанный DataFrame.
+        arrow_path (str): Путь к файлу Arrow.
+        source_stat (os.stat_result, optional): stat исходного CSV, снятый до его чтения.
+            Сохраняется в метаданных схемы для проверки актуальности (см. _is_stale).
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if source_stat is not None:
+        metadata = dict(table.schema.metadata or {})
+        metadata.update(_source_signature(source_stat))
+        table = table.replace_schema_metadata(metadata)
+    tmp_path = f"{arrow_path}.{os.getpid()}.tmp"
+    try:
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, arrow_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _is_stale(file_path, arrow_path):
+    """
+    Проверяет, нужно ли (пере)собрать файл Arrow из исходного CSV.
+
+    Сравнивает (st_mtime_ns, st_size) текущего CSV с сохраненными при сборке.
+    Любое расхождение означает пересборку: и если CSV изменился во время сборки,
+    и если его заменили файлом с более старым временем (cp -p, восстановление из бэкапа).
+    """
+    try:
+        source_stat = os.stat(file_path)
+    except FileNotFoundError:
+        # Исходного CSV нет - используем уже опубликованную версию
+        return not os.path.exists(arrow_path)
+    if not os.path.exists(arrow_path):
+        return True
+
+    with pa.memory_map(arrow_path) as source:
+        # Читается только схема из конца файла, сами данные не трогаются
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    return any(metadata.get(key) != value for key, value in _source_signature(source_stat).items())
+
+
+@st.cache_resource(max_entries=1) # Держим отображение только текущей версии файла
+def _map_shared_dataset(arrow_path, version):
+    """
+    Отображает файл Arrow в память и оборачивает его в DataFrame без копирования.
+
+    Колонки остаются на буферах Arrow (pd.ArrowDtype), поэтому все процессы
+    используют одну физическую копию данных из page cache ОС. Аргумент version
+    нужен только как ключ кэша: при смене версии файл отображается заново.
+    """
+    table = feather.read_table(arrow_path, memory_map=True)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def load_shared_data(file_path='data/dataset.csv', arrow_path=SHARED_DATASET_PATH):
+    """
+    Загружает обработанные данные из общего файла Arrow, отображенного в память.
+
+    Работает только на POSIX: сборку защищает flock, а новая версия подменяет
+    файл, который другие процессы держат отображенным, - Windows этого не
+    позволяет. Там (fcntl недоступен) данные загружаются через load_data
+    отдельно в каждом процессе.
+
+    Если файла нет или исходный CSV изменился с момента сборки, датасет собирается один раз (под файловой
+    блокировкой, чтобы параллельные процессы не делали одну и ту же работу) и
+    публикуется через publish_dataset. Новая версия файла подхватывается автоматически.
+
+    Args:
+        file_path (str): Путь к исходному файлу CSV.
+        arrow_path (str): Путь к общему файлу Arrow.
+
+    Returns:
+        pd.DataFrame: Обработанный DataFrame, или пустой DataFrame при ошибке.
+    """
+    if fcntl is None:
+        return load_data(file_path)
+    return _load_or_report(file_path, lambda: _load_shared(file_path, arrow_path))
+
+
+def _load_shared(file_path, arrow_path):
+    """Собирает общий файл Arrow при необходимости и отображает его текущую версию."""
+    if _is_stale(file_path, arrow_path):
+        with open(f"{arrow_path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Пока ждали блокировку, другой процесс мог уже опубликовать датасет
+            if _is_stale(file_path, arrow_path):
+                # stat снимаем до чтения: если CSV изменится во время сборки,
+                # метаданные не совпадут и следующая проверка пересоберет датасет
+                source_stat = os.stat(file_path)
+                publish_dataset(read_dataset(file_path), arrow_path, source_stat)
+
+    info = os.stat(arrow_path)
+    return _map_shared_dataset(arrow_path, (info.st_ino, info.st_mtime_ns))
+
+
+if __name__ == '__main__':
+    # Пересборка общего датасета вручную: python data_loader.py [путь_к_csv] [путь_к_arrow]
+    import sys
+
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else 'data/dataset.csv'
+    out_path = sys.argv[2] if len(sys.argv) > 2 else SHARED_DATASET_PATH
+    csv_stat = os.stat(csv_path)
+    publish_dataset(read_dataset(csv_path), out_path, csv_stat)
+    print(f"Датасет опубликован: {out_path}")
@@ -0,0 +1,428 @@
+import errno
+import io
+import os
+import socketserver
+import stat
+import threading
+from collections import deque
+
+import pandas as pd
+import streamlit as st
+
+from data_loader import CSV_READ_OPTIONS, add_event_features, add_order_status
+
+# Колонки лога событий, если источник не прислал строку заголовка (канал, сокет)
+DEFAULT_COLUMNS = ['case', 'stage', 'start_time', 'end_time', 'Территория', 'Время работы', 'Оценка доставки']
+
+# Сколько байт читать из источника за один опрос (ограничивает стоимость обновления)
+MAX_READ_BYTES = 4 * 1024 * 1024
+# Сколько непрочитанных строк хранить для сокета (старые вытесняются)
+MAX_PENDING_LINES = 100_000
+# Сокет live-режима принимает события только с локальной машины
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost')
+# До какой доли max_rows окно урезается при переполнении (запас, чтобы не сортировать окно на каждом опросе)
+CAP_TRIM_RATIO = 0.9
+# После скольких порций окно склеивается в одну (чтобы concat не рос с числом опросов)
+MAX_CHUNKS = 64
+
+
+class FileTailSource:
+    """
+    Читает новые строки из дописываемого файла или именованного канала (FIFO).
+
+    По умолчанию чтение начинается с конца файла (как tail -f): старая история
+    уже доступна в обычном режиме, а догонять большой лог по max_read_bytes за
+    обновление пришлось бы сотни обновлений. Строка заголовка в начале файла
+    при этом все равно возвращается первой, чтобы порядок колонок был известен.
+    from_start=True читает файл с начала. При усечении или ротации новый файл
+    читается с начала.
+    """
+
+    def __init__(self, path, max_read_bytes=MAX_READ_BYTES, from_start=False):
+        self.path = path
+        self.max_read_bytes = max_read_bytes
+        self.from_start = from_start
+        self._fd = None
+        self._inode = None
+        self._offset = 0
+        self._is_fifo = False
+        self._partial = b''
+
+    def _open(self, from_start=True):
+        # O_NONBLOCK нужен, чтобы открытие и чтение канала без писателя не блокировали дашборд
+        self._fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        info = os.fstat(self._fd)
+        self._inode = info.st_ino
+        self._is_fifo = stat.S_ISFIFO(info.st_mode)
+        self._offset = 0
+        self._partial = b''
+        if self._is_fifo or from_start or info.st_size == 0:
+            return []
+
+        # Начинаем с конца файла, но отдаем строку заголовка, если она есть
+        self._offset = info.st_size
+        first_line = os.pread(self._fd, 64 * 1024, 0).split(b'\n', 1)[0].rstrip(b'\r')
+        sep = CSV_READ_OPTIONS['sep'].encode(CSV_READ_OPTIONS['encoding'])
+        if first_line.split(sep, 1)[0] == b'case':
+            return [first_line]
+        return []
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def read_lines(self):
+        """
+        Возвращает новые полные строки (bytes), появившиеся с прошлого вызова.
+
+        Returns:
+            list[bytes]: Строки без символа перевода строки. Пустой список, если новых данных нет
+                или файл (еще) не существует.
+        """
+        lines = []
+        if self._fd is None:
+            try:
+                lines = self._open(self.from_start)
+            except FileNotFoundError:
+                # Файл появится позже - тогда его нужно прочитать целиком
+                self.from_start = True
+                return []
+
+        if not self._is_fifo:
+            try:
+                info = os.stat(self.path)
+            except FileNotFoundError:
+                return []
+            # Файл пересоздан (ротация) или усечен - читаем его с начала
+            if info.st_ino != self._inode or info.st_size < self._offset:
+                self.close()
+                self._open()
+
+        try:
+            if self._is_fifo:
+                data = os.read(self._fd, self.max_read_bytes)
+            else:
+                data = os.pread(self._fd, self.max_read_bytes, self._offset)
+        except BlockingIOError:
+            return lines
+        self._offset += len(data)
+
+        data = self._partial + data
+        new_lines = data.split(b'\n')
+        # Последний элемент - незавершенная строка, дочитаем ее в следующий раз
+        self._partial = new_lines.pop()
+        return lines + [line.rstrip(b'\r') for line in new_lines if line.strip()]
+
+
+class _ReusableTCPServer(socketserver.ThreadingTCPServer):
+    """TCP-сервер, который можно сразу перезапустить на том же порту."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class SocketTailSource:
+    """
+    Принимает строки событий по TCP на локальном адресе (по одной строке на событие).
+
+    Сервер работает в фоновом потоке; непрочитанные строки хранятся в ограниченной
+    очереди, при переполнении самые старые вытесняются.
+    """
+
+    def __init__(self, host, port, max_pending_lines=MAX_PENDING_LINES):
+        pending = deque(maxlen=max_pending_lines)
+        self._pending = pending
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if line.strip():
+                        pending.append(line.rstrip(b'\r\n'))
+
+        self._server = _ReusableTCPServer((host, port), _Handler)
+        # Фактический адрес (при port=0 порт выбирает ОС)
+        self.address = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def read_lines(self):
+        """
+        Возвращает строки (bytes), принятые с прошлого вызова.
+
+        Returns:
+            list[bytes]: Принятые строки.
+        """
+        lines = []
+        while self._pending:
+            lines.append(self._pending.popleft())
+        return lines
+
+
+def open_source(spec):
+    """
+    Создает источник событий по строке вида 'путь/к/файлу' или 'tcp://[хост:]порт'.
+
+    Сокет всегда слушает только loopback-адрес: события без аутентификации
+    принимаются лишь от процессов на той же машине. Порт может занять только
+    один процесс, поэтому tcp:// подходит для одного процесса дашборда; при
+    нескольких воркерах (см. load_shared_data) используйте дописываемый файл -
+    каждый воркер читает его сам. Канал (FIFO) для нескольких воркеров тоже не
+    подходит: каждая строка достается только одному читателю.
+
+    Args:
+        spec (str): Путь к файлу или каналу, либо адрес сокета.
+
+    Returns:
+        FileTailSource | SocketTailSource: Источник с методом read_lines().
+
+    Raises:
+        ValueError: Если для сокета указан не локальный адрес или некорректный порт.
+        OSError: Если порт уже занят (например, другим воркером дашборда).
+    """
+    if spec.startswith('tcp://'):
+        host, _, port = spec[len('tcp://'):].rpartition(':')
+        host = host or '127.0.0.1'
+        if host not in LOOPBACK_HOSTS:
+            raise ValueError(f"сокет live-режима может слушать только локальный адрес, а не '{host}'")
+        try:
+            return SocketTailSource(host, int(port))
+        except OSError as e:
+            if e.errno == errno.EADDRINUSE:
+                raise OSError(e.errno, f"порт {port} уже занят; сокет-источник поддерживает только "
+                                       f"один процесс дашборда, для нескольких воркеров используйте файл") from e
+            raise
+    return FileTailSource(spec)
+
+
+class LiveWindow:
+    """
+    Скользящее окно последних событий фиксированного размера.
+
+    События хранятся порциями в кольцевом буфере вместе с минимальным start_time
+    каждой порции. Устаревшие события (старше window_hours от самого свежего) и
+    лишние (сверх max_rows, начиная с самых старых) вытесняются. Лог не обязан
+    быть упорядочен по времени (dataset.csv, например, упорядочен по заказам),
+    поэтому устаревание проверяется для каждой порции, а не только для первой.
+
+    Инкрементально обновляются только счетчики (rows, canceled_events, latest).
+    Снимок для вкладок (concat и статусы заказов) пересобирается после новых
+    событий, и вкладки считают по нему с нуля: ограничены размер буфера и
+    стоимость обновления (не больше max_rows событий), но не более того.
+    """
+
+    def __init__(self, window_hours=24, max_rows=200_000):
+        self.window = pd.Timedelta(hours=window_hours)
+        self.max_rows = max_rows
+        # Элементы: (минимальный start_time порции, порция)
+        self._chunks = deque()
+        self._rows = 0
+        self._latest = None
+        # Нижняя граница после урезания по max_rows: более старые события уже вытеснены,
+        # поэтому опоздавшие события старше нее тоже не принимаем
+        self._floor = None
+        self._version = 0
+        self._snapshot = None
+        self._snapshot_version = -1
+        # Счетчики по окну
+        self._canceled_events = 0
+
+    def _update_aggregates(self, chunk, sign):
+        self._rows += sign * len(chunk)
+        self._canceled_events += sign * int(chunk['is_canceled'].sum())
+
+    def _reset(self, window_df):
+        """Заменяет содержимое буфера одной порцией и пересчитывает счетчики."""
+        self._chunks = deque()
+        self._rows = 0
+        self._canceled_events = 0
+        if not window_df.empty:
+            self._chunks.append((window_df['start_time'].min(), window_df))
+            self._update_aggregates(window_df, +1)
+
+    def _cutoff(self):
+        cutoff = self._latest - self.window
+        if self._floor is not None:
+            cutoff = max(cutoff, self._floor)
+        return cutoff
+
+    def _evict(self):
+        cutoff = self._cutoff()
+        kept = deque()
+        for min_start, chunk in self._chunks:
+            if min_start >= cutoff:
+                kept.append((min_start, chunk))
+                continue
+            keep_mask = chunk['start_time'] >= cutoff
+            self._update_aggregates(chunk[~keep_mask], -1)
+            if keep_mask.any():
+                chunk = chunk[keep_mask]
+                kept.append((chunk['start_time'].min(), chunk))
+        self._chunks = kept
+
+        # Жесткий предел по числу строк: оставляем самые свежие события, а не те,
+        # что первыми лежат в буфере. Урезаем с запасом, чтобы полная сортировка
+        # окна происходила раз в (1 - CAP_TRIM_RATIO) * max_rows новых событий,
+        # а не на каждом опросе
+        if self._rows > self.max_rows:
+            keep_rows = max(1, int(self.max_rows * CAP_TRIM_RATIO))
+            window_df = pd.concat([chunk for _, chunk in self._chunks], ignore_index=True)
+            window_df = window_df.sort_values('start_time', kind='stable').iloc[-keep_rows:]
+            self._floor = window_df['start_time'].iloc[0]
+            self._reset(window_df.reset_index(drop=True))
+
+        # Склеиваем мелкие порции, чтобы число кусков в буфере оставалось ограниченным
+        if len(self._chunks) > MAX_CHUNKS:
+            self._reset(pd.concat([chunk for _, chunk in self._chunks], ignore_index=True))
+
+    def append(self, chunk):
+        """
+        Добавляет порцию событий (с признаками из add_event_features) и вытесняет устаревшие.
+
+        Args:
+            chunk (pd.DataFrame): Новые события.
+        """
+        chunk = chunk.dropna(subset=['start_time'])
+        if chunk.empty:
+            return
+
+        chunk_latest = chunk['start_time'].max()
+        self._latest = chunk_latest if self._latest is None else max(self._latest, chunk_latest)
+
+        # События, которые уже не попадают в окно, в буфер не кладем
+        chunk = chunk[chunk['start_time'] >= self._cutoff()]
+        if not chunk.empty:
+            self._chunks.append((chunk['start_time'].min(), chunk))
+            self._update_aggregates(chunk, +1)
+
+        self._evict()
+        self._version += 1
+
+    def snapshot(self, hours=None):
+        """
+        Возвращает содержимое окна одним DataFrame со статусами заказов.
+
+        Результат пересчитывается только после появления новых событий. Окно общее
+        для всех сессий, поэтому меньший период сессии применяется как фильтр
+        к снимку, а не меняет само окно.
+
+        Args:
+            hours (int, optional): Показать только последние hours часов окна.
+
+        Returns:
+            pd.DataFrame: События в окне (пустой DataFrame, если событий нет).
+        """
+        if self._snapshot_version != self._version:
+            if self._chunks:
+                self._snapshot = add_order_status(
+                    pd.concat([chunk for _, chunk in self._chunks], ignore_index=True)
+                )
+            else:
+                self._snapshot = pd.DataFrame()
+            self._snapshot_version = self._version
+        if hours is None or self._snapshot.empty or pd.Timedelta(hours=hours) >= self.window:
+            return self._snapshot
+        return self._snapshot[self._snapshot['start_time'] >= self._latest - pd.Timedelta(hours=hours)]
+
+    def stats(self):
+        """
+        Возвращает счетчики по окну без обхода самих событий.
+
+        Returns:
+            dict: rows - число событий, canceled_events - число этапов отмены,
+                latest - время самого свежего события.
+        """
+        return {
+            'rows': self._rows,
+            'canceled_events': self._canceled_events,
+            'latest': self._latest,
+        }
+
+
+class LiveTail:
+    """Связывает источник событий с окном: разбирает новые строки и добавляет их в окно."""
+
+    def __init__(self, source, window):
+        self.source = source
+        self.window = window
+        self.columns = list(DEFAULT_COLUMNS)
+        self._lock = threading.Lock()
+
+    def _parse(self, lines):
+        encoding = CSV_READ_OPTIONS['encoding']
+        sep = CSV_READ_OPTIONS['sep']
+        rows = []
+        for line in lines:
+            text = line.decode(encoding, errors='replace')
+            # Строка заголовка (например, в начале файла) задает порядок колонок
+            if text.split(sep, 1)[0] == 'case':
+                self.columns = text.split(sep)
+                continue
+            rows.append(text)
+        if not rows:
+            return None
+
+        missing = [col for col in DEFAULT_COLUMNS if col not in self.columns]
+        if missing:
+            raise ValueError(f"в заголовке источника нет колонок: {', '.join(missing)}")
+
+        chunk = pd.read_csv(
+            io.StringIO('\n'.join(rows)),
+            sep=sep,
+            header=None,
+            names=self.columns,
+            on_bad_lines='skip'
+        )
+        # Даты разбираем сами: некорректные превращаются в NaT, а не ломают всю порцию
+        for col in ('start_time', 'end_time'):
+            chunk[col] = pd.to_datetime(chunk[col], errors='coerce', dayfirst=CSV_READ_OPTIONS['dayfirst'])
+        return add_event_features(chunk)
+
+    def poll(self):
+        """
+        Читает новые события из источника и добавляет их в окно.
+
+        Returns:
+            int: Сколько строк прочитано из источника (0 - новых данных нет).
+        """
+        with self._lock:
+            lines = self.source.read_lines()
+            try:
+                chunk = self._parse(lines)
+            except Exception as e:
+                st.error(f"Ошибка при разборе новых событий: {e}")
+                return len(lines)
+            if chunk is not None:
+                self.window.append(chunk)
+            return len(lines)
+
+    def snapshot(self, hours=None):
+        with self._lock:
+            return self.window.snapshot(hours)
+
+    def stats(self):
+        with self._lock:
+            return self.window.stats()
+
+
+@st.cache_resource # Один источник и одно окно на процесс для всех сессий
+def get_live_tail(source_spec, window_hours=24, max_rows=200_000):
+    """
+    Возвращает общий для всех сессий LiveTail для указанного источника.
+
+    Источник и размер окна - настройки сервера, поэтому на процесс создается
+    один LiveTail; сессии сужают период через snapshot(hours).
+
+    Args:
+        source_spec (str): Путь к файлу или каналу, либо 'tcp://[хост:]порт'.
+        window_hours (int): Размер окна в часах (по времени событий).
+        max_rows (int): Максимальное число событий в окне.
+
+    Returns:
+        LiveTail: Объект с методами poll(), snapshot() и stats().
+    """
+    return LiveTail(open_source(source_spec), LiveWindow(window_hours, max_rows))
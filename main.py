@@ -1,9 +1,11 @@
+import os
 import streamlit as st
 import pandas as pd
 from datetime import datetime
 
 # Импортируем функции из наших модулей
-from data_loader import load_data
+from data_loader import load_shared_data
+from live_tail import get_live_tail
 from tabs.projections import render_projections_tab
 from tabs.resources import render_resources_tab
 from tabs.details import render_details_tab
@@ -17,10 +19,87 @@ st.set_page_config(
 
 st.title("📊 Дашборд Анализа Процессов Заказов")
 
-# --- Загрузка данных ---
 # Укажите правильный путь к вашему файлу
 DATA_PATH = 'data/dataset.csv'
-df = load_data(DATA_PATH)
+# Источник live-режима задается на сервере (файл, канал или tcp://порт), а не в браузере.
+# По умолчанию не задан: статичный DATA_PATH не дописывается, и live-режим ждал бы вечно
+LIVE_SOURCE = os.environ.get('DASHBOARD_LIVE_SOURCE')
+# Размер общего окна live-режима (часы); сессии могут смотреть только его часть
+LIVE_WINDOW_HOURS = int(os.environ.get('DASHBOARD_LIVE_WINDOW_HOURS', 24))
+
+
+def render_tabs(filtered_df):
+    """Отрисовывает вкладки дашборда для отфильтрованных данных."""
+    tab_titles = ["Прогнозы", "Ресурсы", "Детализация"]
+    tab1, tab2, tab3 = st.tabs(tab_titles)
+
+    with tab1:
+        render_projections_tab(filtered_df)
+
+    with tab2:
+        render_resources_tab(filtered_df)
+
+    with tab3:
+        render_details_tab(filtered_df)
+
+
+# --- Live-режим ---
+st.sidebar.header('Источник данных')
+live_mode = st.sidebar.toggle('Live-режим', value=False,
+                              help="Следить за новыми событиями в дописываемом файле, канале или сокете")
+
+if live_mode:
+    if not LIVE_SOURCE:
+        st.info("ℹ️ Источник live-режима не настроен. Укажите дописываемый файл, канал или tcp://порт "
+                "в переменной окружения `DASHBOARD_LIVE_SOURCE` и перезапустите дашборд.")
+        st.stop()
+
+    live_source = LIVE_SOURCE
+    st.sidebar.caption(f"Источник событий: `{live_source}`")
+    window_hours = st.sidebar.number_input('Окно, часов', min_value=1, max_value=LIVE_WINDOW_HOURS,
+                                           value=LIVE_WINDOW_HOURS)
+    refresh_seconds = st.sidebar.number_input('Обновление, сек', min_value=1, max_value=600, value=10)
+
+    try:
+        live_tail = get_live_tail(live_source, LIVE_WINDOW_HOURS)
+    except (OSError, ValueError) as e:
+        st.error(f"Не удалось подключиться к источнику '{live_source}': {e}")
+        st.stop()
+
+    # Перерисовываем только вкладки по таймеру, без перезапуска всего скрипта
+    @st.fragment(run_every=int(refresh_seconds))
+    def render_live_dashboard():
+        live_tail.poll()
+        live_df = live_tail.snapshot(int(window_hours))
+        stats = live_tail.stats()
+
+        if live_df.empty:
+            st.info(f"⏳ Ожидание событий из '{live_source}'...")
+            return
+
+        territory_list = ['Все территории'] + sorted(live_df['Территория'].astype(str).unique().tolist())
+        selected_territory = st.selectbox('Территория', territory_list, key='live_territory')
+        filtered_df = live_df
+        if selected_territory != 'Все территории':
+            filtered_df = live_df[live_df['Территория'].astype(str) == selected_territory]
+
+        st.caption(
+            f"Окно: последние {int(window_hours)} ч. до {stats['latest'].strftime('%d.%m.%Y %H:%M')} · "
+            f"{len(live_df)} событий ({int(live_df['is_canceled'].sum())} этапов отмены) · "
+            f"обновлено {datetime.now().strftime('%H:%M:%S')}"
+        )
+
+        if filtered_df.empty:
+            st.warning("⚠️ Нет данных для отображения с выбранными фильтрами.")
+        else:
+            render_tabs(filtered_df)
+
+    render_live_dashboard()
+    st.stop()
+
+# --- Загрузка данных ---
+# Все процессы дашборда читают один общий файл Arrow, отображенный в память
+df = load_shared_data(DATA_PATH)
 
 # --- Основная логика ---
 if not df.empty:
@@ -67,17 +146,7 @@ if not df.empty:
         st.success(f"Загружено и отфильтровано {len(filtered_df)} записей этапов ({filtered_df['case'].nunique()} уникальных заказов).")
 
         # --- Создание вкладок ---
-        tab_titles = ["Прогнозы", "Ресурсы", "Детализация"]
-        tab1, tab2, tab3 = st.tabs(tab_titles)
-
-        with tab1:
-            render_projections_tab(filtered_df)
-
-        with tab2:
-            render_resources_tab(filtered_df)
-
-        with tab3:
-            render_details_tab(filtered_df)
+        render_tabs(filtered_df)
 
         # --- Информация о фильтрах и обновлении ---
         st.sidebar.write("---")
@@ -86,5 +155,5 @@ if not df.empty:
         st.sidebar.info(f"Данные обновлены: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}")
 
 else:
-    # Это сообщение будет показано, если load_data вернул пустой DataFrame
+    # Это сообщение будет показано, если load_shared_data вернул пустой DataFrame
     st.error("Не удалось загрузить или обработать данные. Дальнейшее отображение невозможно.")
@@ -0,0 +1,76 @@
+import os
+
+import pandas as pd
+import pytest
+
+import data_loader
+from data_loader import _is_stale, load_shared_data, publish_dataset, read_dataset
+
+pytestmark = pytest.mark.skipif(data_loader.fcntl is None, reason='общий датасет поддерживается только на POSIX')
+
+HEADER = ['case', 'stage', 'start_time', 'end_time', 'Территория', 'Время работы', 'Оценка доставки']
+
+
+def write_csv(path, n_cases):
+    lines = ['\t'.join(HEADER)]
+    for case in range(n_cases):
+        lines.append('\t'.join([str(100 + case), 'Заказ оформлен', '03.12.2022 16:28', '03.12.2022 16:29',
+                                '13', 'с 10 до 22', '']))
+        lines.append('\t'.join([str(100 + case), 'Заказ доставлен', '03.12.2022 16:29', '03.12.2022 17:10',
+                                '13', 'с 10 до 22', '5']))
+    path.write_bytes(('\n'.join(lines) + '\n').encode('cp1251'))
+
+
+def mapping_key(arrow_path):
+    info = os.stat(arrow_path)
+    return info.st_ino, info.st_mtime_ns
+
+
+def test_shared_dataset_is_published_and_mapped_without_copy(tmp_path):
+    csv_path, arrow_path = tmp_path / 'dataset.csv', tmp_path / 'dataset.arrow'
+    write_csv(csv_path, n_cases=3)
+
+    df = load_shared_data(str(csv_path), str(arrow_path))
+
+    assert arrow_path.exists()
+    assert len(df) == 6
+    assert (df['order_status'] == 'Доставлен').all()
+    # Колонки остаются на буферах Arrow - копии в памяти процесса нет
+    assert all(isinstance(dtype, pd.ArrowDtype) for dtype in df.dtypes)
+    assert not _is_stale(str(csv_path), str(arrow_path))
+    # Без изменений CSV повторная загрузка отдает то же отображение
+    assert load_shared_data(str(csv_path), str(arrow_path)) is df
+
+
+def test_rebuild_after_csv_change_maps_new_version(tmp_path):
+    csv_path, arrow_path = tmp_path / 'dataset.csv', tmp_path / 'dataset.arrow'
+    write_csv(csv_path, n_cases=3)
+    first = load_shared_data(str(csv_path), str(arrow_path))
+    first_key = mapping_key(arrow_path)
+
+    # Новый CSV со старым временем изменения (как после cp -p или восстановления из бэкапа)
+    old_mtime_ns = os.stat(csv_path).st_mtime_ns
+    write_csv(csv_path, n_cases=5)
+    os.utime(csv_path, ns=(old_mtime_ns - 10**9, old_mtime_ns - 10**9))
+    assert _is_stale(str(csv_path), str(arrow_path))
+
+    second = load_shared_data(str(csv_path), str(arrow_path))
+
+    assert mapping_key(arrow_path) != first_key
+    assert second is not first
+    assert len(second) == 10
+    assert len(first) == 6
+    assert all(isinstance(dtype, pd.ArrowDtype) for dtype in second.dtypes)
+
+
+def test_csv_changed_during_build_is_stale(tmp_path):
+    csv_path, arrow_path = tmp_path / 'dataset.csv', tmp_path / 'dataset.arrow'
+    write_csv(csv_path, n_cases=3)
+    stat_before_read = os.stat(csv_path)
+    df = read_dataset(str(csv_path))
+
+    # CSV переписан, пока шла сборка; файл Arrow публикуется уже после этого
+    write_csv(csv_path, n_cases=4)
+    publish_dataset(df, str(arrow_path), stat_before_read)
+
+    assert _is_stale(str(csv_path), str(arrow_path))
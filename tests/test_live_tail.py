@@ -0,0 +1,182 @@
+import os
+import random
+import socket
+import time
+
+import pandas as pd
+import pytest
+
+from live_tail import DEFAULT_COLUMNS, FileTailSource, LiveTail, LiveWindow, SocketTailSource, open_source
+
+STAGES = ['Заказ оформлен', 'Сборка заказа', 'Заказ доставлен']
+
+
+def write_unordered_log(path, n_cases=300):
+    """Пишет лог, упорядоченный по заказам (как dataset.csv), а не по времени."""
+    rng = random.Random(0)
+    base = pd.Timestamp('2022-10-01')
+    lines = ['\t'.join(DEFAULT_COLUMNS)]
+    events = []
+    for case in range(n_cases):
+        case_start = base + pd.Timedelta(minutes=rng.randrange(90 * 24 * 60))
+        for i, stage in enumerate(STAGES):
+            start = case_start + pd.Timedelta(minutes=10 * i)
+            end = start + pd.Timedelta(minutes=10)
+            lines.append('\t'.join([
+                str(10_000 + case), stage,
+                start.strftime('%d.%m.%Y %H:%M'), end.strftime('%d.%m.%Y %H:%M'),
+                '13', 'с 10 до 22', '5',
+            ]))
+            events.append({'case': 10_000 + case, 'stage': stage, 'start_time': start})
+    path.write_bytes(('\n'.join(lines) + '\n').encode('cp1251'))
+    return pd.DataFrame(events)
+
+
+def replay(path, window):
+    # Маленький буфер чтения, чтобы события приходили многими порциями
+    tail = LiveTail(FileTailSource(str(path), max_read_bytes=2048, from_start=True), window)
+    while tail.poll():
+        pass
+    return tail
+
+
+def test_window_keeps_only_recent_events_from_unordered_log(tmp_path):
+    path = tmp_path / 'events.csv'
+    events = write_unordered_log(path)
+    tail = replay(path, LiveWindow(window_hours=24, max_rows=500))
+
+    latest = events['start_time'].max()
+    cutoff = latest - pd.Timedelta(hours=24)
+    snapshot = tail.snapshot()
+
+    assert tail.stats()['latest'] == latest
+    assert (snapshot['start_time'] >= cutoff).all()
+    expected = events[events['start_time'] >= cutoff]
+    assert set(zip(snapshot['case'], snapshot['stage'])) == set(zip(expected['case'], expected['stage']))
+    assert tail.stats()['rows'] == len(snapshot)
+
+    # Дописанная строка не должна опустошать окно
+    with open(path, 'ab') as f:
+        f.write('\t'.join([
+            '99999', STAGES[0], latest.strftime('%d.%m.%Y %H:%M'), latest.strftime('%d.%m.%Y %H:%M'),
+            '13', 'с 10 до 22', '',
+        ]).encode('cp1251') + b'\n')
+    tail.poll()
+    assert tail.stats()['rows'] == len(expected) + 1
+    assert len(tail.snapshot()) == len(expected) + 1
+
+
+def test_row_cap_keeps_newest_events(tmp_path):
+    path = tmp_path / 'events.csv'
+    events = write_unordered_log(path)
+    tail = replay(path, LiveWindow(window_hours=24 * 365, max_rows=100))
+
+    snapshot = tail.snapshot()
+    assert 0 < len(snapshot) <= 100
+    assert tail.stats()['rows'] == len(snapshot)
+    newest = events['start_time'].sort_values().iloc[-len(snapshot):]
+    assert sorted(snapshot['start_time']) == sorted(newest)
+
+
+def test_session_hours_filter_snapshot_without_shrinking_window(tmp_path):
+    path = tmp_path / 'events.csv'
+    events = write_unordered_log(path)
+    tail = replay(path, LiveWindow(window_hours=24 * 7, max_rows=10_000))
+    rows_before = tail.stats()['rows']
+
+    latest = events['start_time'].max()
+    snapshot = tail.snapshot(hours=24)
+    assert (snapshot['start_time'] >= latest - pd.Timedelta(hours=24)).all()
+    assert len(snapshot) == (events['start_time'] >= latest - pd.Timedelta(hours=24)).sum()
+
+    # Период одной сессии не вытесняет события для остальных
+    assert tail.stats()['rows'] == rows_before
+    assert len(tail.snapshot()) == rows_before
+
+
+def test_header_with_missing_column_is_reported_not_raised(tmp_path):
+    path = tmp_path / 'events.csv'
+    columns = [col for col in DEFAULT_COLUMNS if col != 'Оценка доставки']
+    path.write_bytes(('\t'.join(columns) + '\n'
+                      + '\t'.join(['1', STAGES[0], '03.12.2022 16:28', '03.12.2022 16:29', '13', 'с 10 до 22'])
+                      + '\n').encode('cp1251'))
+    tail = LiveTail(FileTailSource(str(path), from_start=True), LiveWindow())
+
+    tail.poll()
+
+    assert tail.stats()['rows'] == 0
+    assert tail.snapshot().empty
+
+
+def test_file_source_starts_at_end_but_returns_header(tmp_path):
+    path = tmp_path / 'events.csv'
+    write_unordered_log(path, n_cases=10)
+    source = FileTailSource(str(path))
+
+    assert source.read_lines() == ['\t'.join(DEFAULT_COLUMNS).encode('cp1251')]
+
+    new_line = '\t'.join(['1', STAGES[0], '03.12.2022 16:28', '03.12.2022 16:29', '13', 'с 10 до 22', '5'])
+    with open(path, 'ab') as f:
+        f.write(new_line.encode('cp1251') + b'\n')
+    assert source.read_lines() == [new_line.encode('cp1251')]
+
+
+def test_file_source_rereads_truncated_file(tmp_path):
+    path = tmp_path / 'events.csv'
+    path.write_bytes(b'first line\nsecond line\n')
+    source = FileTailSource(str(path), from_start=True)
+    assert source.read_lines() == [b'first line', b'second line']
+
+    path.write_bytes(b'new\n')
+    assert source.read_lines() == [b'new']
+
+
+def test_file_source_follows_rotated_file(tmp_path):
+    path = tmp_path / 'events.csv'
+    path.write_bytes(b'old\n')
+    source = FileTailSource(str(path), from_start=True)
+    assert source.read_lines() == [b'old']
+
+    rotated = tmp_path / 'events.csv.new'
+    rotated.write_bytes(b'rotated one\nrotated two\n')
+    os.replace(rotated, path)
+    assert source.read_lines() == [b'rotated one', b'rotated two']
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='именованные каналы есть только на POSIX')
+def test_file_source_reads_fifo(tmp_path):
+    path = tmp_path / 'events.fifo'
+    os.mkfifo(path)
+    source = FileTailSource(str(path))
+    assert source.read_lines() == []
+
+    writer = os.open(path, os.O_WRONLY)
+    try:
+        os.write(writer, b'one\ntw')
+        assert source.read_lines() == [b'one']
+        os.write(writer, b'o\n')
+        assert source.read_lines() == [b'two']
+    finally:
+        os.close(writer)
+        source.close()
+
+
+def test_socket_source_receives_lines_on_loopback():
+    source = SocketTailSource('127.0.0.1', 0)
+    try:
+        with socket.create_connection(source.address) as conn:
+            conn.sendall(b'one\r\n\ntwo\n')
+
+        lines = []
+        deadline = time.monotonic() + 5
+        while len(lines) < 2 and time.monotonic() < deadline:
+            lines += source.read_lines()
+            time.sleep(0.01)
+        assert lines == [b'one', b'two']
+    finally:
+        source.close()
+
+
+def test_socket_source_rejects_non_loopback_host():
+    with pytest.raises(ValueError):
+        open_source('tcp://0.0.0.0:0')